@@ -75,6 +75,7 @@ class InterpolateSampleCommand(Command):
         ).as_dict()
         # Set posterior samples
         archive.model.set_samples(samples=1)
+        archive.model.set_inference()
         # Run it
         output_dict = archive.model.interpolate(
             input_dict["src_tokens"], samples=num_samples, random=self.option("random")
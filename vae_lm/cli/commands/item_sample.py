@@ -68,8 +68,13 @@ class ItemSampleCommand(Command):
         ).as_dict()
         # Set posterior samples
         archive.model.set_samples(num_samples)
-        # Run it
-        output_dict = archive.model(**input_dict, random=self.option("random"))
+        archive.model.set_inference()
+        # Run it. Encode items once and draw all samples from the encoded output.
+        # Target is passed so that items are reconstructed as in forward.
+        encoded = archive.model.encode(input_dict["src_tokens"])
+        output_dict = archive.model.decode_from_encoded(
+            encoded, target=input_dict["tgt_tokens"], random=self.option("random")
+        )
         # Make it readable
         samples = archive.model.make_output_human_readable(output_dict)
         print(samples)
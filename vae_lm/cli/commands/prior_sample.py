@@ -62,6 +62,7 @@ class PriorSampleCommand(Command):
             log_metrics("Trained model", archive.metrics)
         num_samples = int(self.option("num-samples"))
         lengths = self.parse_lengths()
+        archive.model.set_inference()
         samples, samples_log_prob = archive.model.sample(num_samples, lengths)
         # TODO: Make better output by truncating <eos> tokens
         samples = archive.model.make_output_human_readable(samples)
@@ -2,7 +2,6 @@ from typing import Dict, List
 import os
 import re
 import json
-import wandb
 from pathlib import Path
 from loguru import logger
 from .command import BaseCommand
@@ -87,6 +86,8 @@ class TrainCommand(BaseCommand):
         # Login to wandb there
         use_wandb = self.option("use-wandb")
         if use_wandb:
+            import wandb
+
             wandb.login(key=os.getenv("WANDB_LOGIN_KEY"))
         # Add extra properties to config
         config["serialization_dir"] = str(serialization_dir)
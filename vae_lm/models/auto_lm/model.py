@@ -106,17 +106,11 @@ class AutoModel(VAELmModel):
             "preds": predictions,
         }
         if target is not None:
-            # Get padding mask
-            weights = util.get_tokens_mask(target).float()
             # Get sequence excluding start of sequence token
-            # as it is being predicted by the model
+            # as it is being predicted by the model.
+            # Padding is ignored in loss so we do not need to pass mask.
             relevant_target = target[:, 1:].contiguous()
-            relevant_weights = weights[:, 1:].contiguous()
-            output_dict["loss"] = self._loss(
-                output_dict["logits"],
-                relevant_target,
-                weights=relevant_weights,
-            )
+            output_dict["loss"] = self._loss(output_dict["logits"], relevant_target)
         return output_dict
 
     @overrides
@@ -1,4 +1,4 @@
-from typing import Union, List, Type, T, Tuple
+from typing import Union, List, Type, T, Tuple, Optional
 import torch
 from .flow import Flow
 from copy import deepcopy
@@ -119,6 +119,42 @@ class RecurrentCoupling(Coupling):
         return cls(core, **params)
 
 
+@torch.jit.script
+def _affine_forward(
+    x0: torch.Tensor,
+    x1: torch.Tensor,
+    s: torch.Tensor,
+    t: torch.Tensor,
+    mask: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Scripted forward affine transformation so that pointwise operations are fused."""
+    y1 = torch.exp(s) * x1 + t
+    z = torch.cat([x0, y1], dim=-1)
+    log_det = torch.sum(s, dim=-1)
+    if mask is not None:
+        z = z * mask.unsqueeze(-1)
+        log_det = log_det.mul(mask).sum(dim=-1)
+    return z, log_det
+
+
+@torch.jit.script
+def _affine_backward(
+    x0: torch.Tensor,
+    x1: torch.Tensor,
+    s: torch.Tensor,
+    t: torch.Tensor,
+    mask: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Scripted inverse affine transformation so that pointwise operations are fused."""
+    y1 = (x1 - t) * torch.exp(-s)
+    z = torch.cat([x0, y1], dim=-1)
+    log_det = torch.sum(-s, dim=-1)
+    if mask is not None:
+        z = z * mask.unsqueeze(-1)
+        log_det = log_det.mul(mask).sum(dim=-1)
+    return z, log_det
+
+
 @Flow.register("nice")
 class NICECoupling(Flow):
     """
@@ -148,18 +184,10 @@ class NICECoupling(Flow):
         # t ~ (batch size, seq length, hidden size // 2) - for NonAuto
         # t ~ (batch size, hidden size // 2) - for Auto
         t = self._t_net(x0, mask)
-        y0 = x0  # untouched half
-        y1 = torch.exp(s) * x1 + t
         # z ~ (batch size, seq length, hidden size) - for NonAuto
-        # z ~ (batch size, seq length, hidden size) - for Auto
-        z = torch.cat([y0, y1], dim=-1)
-        # log_det ~ (batch size, seq_length) - for NonAuto
-        # log_det ~ (batch size) - for Auto
-        log_det = torch.sum(s, dim=-1)
-        if mask is not None:
-            z *= mask.unsqueeze(-1)
-            log_det = log_det.mul(mask).sum(dim=-1)
-        return z, log_det
+        # z ~ (batch size, hidden size) - for Auto
+        # log_det ~ (batch size)
+        return _affine_forward(x0, x1, s, t, mask)
 
     def backward(self, z: torch.Tensor, mask: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
         x0, x1 = self._split(z)
@@ -169,18 +197,10 @@ class NICECoupling(Flow):
         # t ~ (batch size, seq length, hidden size // 2) - for NonAuto
         # t ~ (batch size, hidden size // 2) - for Auto
         t = self._t_net(x0, mask)
-        y0 = x0  # untouched half
-        y1 = (x1 - t) * torch.exp(-s)
         # z ~ (batch size, seq length, hidden size) - for NonAuto
         # z ~ (batch size, hidden size) - for Auto
-        z = torch.cat([y0, y1], dim=-1)
-        # log_det ~ (batch size, seq_length) - for NonAuto
-        # log_det ~ (batch size) - for Auto
-        log_det = torch.sum(-s, dim=-1)
-        if mask is not None:
-            z *= mask.unsqueeze(-1)
-            log_det = log_det.mul(mask).sum(dim=-1)
-        return z, log_det
+        # log_det ~ (batch size)
+        return _affine_backward(x0, x1, s, t, mask)
 
     @staticmethod
     def _split(z: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
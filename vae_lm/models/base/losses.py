@@ -1,5 +1,11 @@
 from typing import Union, List, Tuple
 import torch
+import inspect
+import torch.nn.functional as F
+
+
+# Label smoothing in cross entropy is available only in torch>=1.10
+_CE_HAS_LABEL_SMOOTHING = "label_smoothing" in inspect.signature(F.cross_entropy).parameters
 
 
 class FocalLoss(torch.nn.Module):
@@ -114,23 +120,32 @@ class LabelSmoothingNLL(torch.nn.Module):
         If smoothing is 0.0 it's a usual NLL Loss.
     size_average : `bool`, optional (default = `True`)
         Whether to size average loss or not.
+    ignore_index : `int`, optional (default = `0`)
+        Padding index in target to ignore if weights are not passed.
     """
 
     def __init__(
         self,
         smoothing: float = 0.0,
-        size_average: bool = True
+        size_average: bool = True,
+        ignore_index: int = 0,
     ) -> None:
         super().__init__()
         self._smoothing = smoothing
         self._size_average = size_average
+        self._ignore_index = ignore_index
 
     def forward(
         self,
         logits: torch.Tensor,
         target: torch.Tensor,
-        weights: torch.FloatTensor,
+        weights: torch.FloatTensor = None,
     ) -> torch.Tensor:
+        if weights is None:
+            smoothing = self._smoothing if self._smoothing and self.training else 0.0
+            if smoothing == 0.0 or _CE_HAS_LABEL_SMOOTHING:
+                return self._fused_forward(logits, target, smoothing)
+            weights = target.ne(self._ignore_index).float()
         # logits ~ (batch size, sequence length, num_classes)
         # target ~ (batch size, sequence length)
         # weights ~ (batch size, sequence length)
@@ -167,3 +182,35 @@ class LabelSmoothingNLL(torch.nn.Module):
             return per_batch_nll_loss.sum() / num_non_empty_sequences
         else:
             return per_batch_nll_loss
+
+    def _fused_forward(
+        self, logits: torch.Tensor, target: torch.Tensor, smoothing: float = 0.0
+    ) -> torch.Tensor:
+        """
+        Compute loss with a single cross entropy call.
+        Padding is masked with `ignore_index` so weights are not needed.
+        """
+        # logits ~ (batch size, sequence length, num_classes)
+        # target ~ (batch size, sequence length)
+        kwargs = {"label_smoothing": smoothing} if smoothing > 0.0 else {}
+        # nll_loss ~ (batch size * sequence length,)
+        nll_loss = F.cross_entropy(
+            logits.view(-1, logits.size(-1)),
+            target.view(-1).long(),
+            ignore_index=self._ignore_index,
+            reduction="none",
+            **kwargs,
+        )
+        # nll_loss ~ (batch size, sequence length)
+        nll_loss = nll_loss.view(*target.size())
+        # tokens_batch_sum ~ (batch_size,)
+        tokens_batch_sum = target.ne(self._ignore_index).view(target.size(0), -1).sum(-1)
+        # per_batch_nll_loss ~ (batch_size,)
+        per_batch_nll_loss = (
+            torch.einsum("b...->b", nll_loss) / torch.clamp(tokens_batch_sum.float(), min=1e-13)
+        )
+        if self._size_average:
+            num_non_empty_sequences = torch.clamp(tokens_batch_sum.gt(0).float().sum(), min=1e-13)
+            return per_batch_nll_loss.sum() / num_non_empty_sequences
+        else:
+            return per_batch_nll_loss
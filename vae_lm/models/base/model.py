@@ -101,6 +101,8 @@ class VAELmModel(TorchModule, Registrable):
         # Other
         # TODO: EOS is hardcoded so we probably need to move it to os.enviorn or something else
         self._end_index = self.vocab.token_to_index("<eos>")
+        # Whether model is used for inference only, e.g. in cli commands
+        self._inference = False
 
     @property
     def nsamples_posterior(self) -> int:
@@ -113,6 +115,14 @@ class VAELmModel(TorchModule, Registrable):
         """
         raise NotImplementedError()
 
+    def set_inference(self, inference: bool = True) -> None:
+        """
+        Set model to inference mode and switch it to `eval` or `train` accordingly.
+        Useful for cli commands with the trained model to enable inference-only optimizations.
+        """
+        self._inference = inference
+        self.train(not inference)
+
     @property
     def is_kl_used(self) -> bool:
         return self._kl_scheduler.weight != 0
@@ -130,28 +140,19 @@ class VAELmModel(TorchModule, Registrable):
         # src_mask ~ (batch size, seq length)
         batch = src_tokens.size(0)
         src_encoded = self.encode(src_tokens)
-        # z ~ (batch size * samples, seq length, hidden size) - for NonAuto
-        # z ~ (batch size * samples, hidden size) - for Auto
+        # latent.z ~ (batch size * samples, seq length, hidden size) - for NonAuto
+        # latent.z ~ (batch size * samples, hidden size) - for Auto
         # posterior_log_prob ~ (batch size * samples)
-        latent, posterior_log_prob = self.sample_from_posterior(src_encoded, random=random)
-        # tgt_mask ~ (batch size, seq length)
-        tgt_mask = util.get_tokens_mask(tgt_tokens) if tgt_tokens is not None else None
         # tgt_mask ~ (batch * samples, seq length)
-        tgt_mask = repeat(
-            tgt_mask, "batch seq -> (batch samples) seq", samples=self.nsamples_posterior
-        ) if tgt_mask is not None else None
+        latent, posterior_log_prob, tgt_mask, decoded_output = self._sample_and_decode(
+            src_encoded, target=tgt_tokens, random=random
+        )
+        if tgt_tokens is None:
+            return {"source": src_tokens, "latent": latent.z, **decoded_output}
         # tgt_tokens ~ (batch * samples, seq length)
-        tgt_tokens = repeat(
-            tgt_tokens, "batch seq -> (batch samples) seq", samples=self.nsamples_posterior
-        ) if tgt_tokens is not None else None
-        decoded_output = {
-            x: self._unwrap_samples(tensor, batch, *tensor.size()[1:])
-            for x, tensor in self.decode(latent.z, tgt_mask, target=tgt_tokens).items()
-        }
+        tgt_tokens = self._repeat_samples(tgt_tokens)
         # prior_log_prob ~ (batch size * samples)
         prior_log_prob = self._get_prior_log_prob(latent, tgt_mask)
-        if tgt_tokens is None:
-            return {"source": src_tokens, "latent": latent.z, **decoded_output}
         # Losses
         # recon_error ~ (batch size, samples)
         recon_error = decoded_output.pop("loss")
@@ -257,6 +258,73 @@ class VAELmModel(TorchModule, Registrable):
         """
         raise NotImplementedError()
 
+    def decode_from_encoded(
+        self, encoded: EncoderOutput, target: torch.Tensor = None, random: bool = True
+    ) -> Dict[str, torch.Tensor]:
+        """
+        Sample latent codes from posterior for already encoded sequence and decode them.
+        It allows to sample from the same input without running encoder again.
+
+        Parameters
+        ----------
+        encoded : `EncoderOutput`, required
+            Encoded source sequence with its mask and context.
+        target : `torch.Tensor`, optional (default = `None`)
+            Target sequence. If passed decoder is teacher-forced with it
+            and reconstruction error is computed like in `forward`.
+        random : `bool`, optional (default = `True`)
+            Whether to add randomness in posterior or not.
+
+        Returns
+        -------
+        `Dict[str, torch.Tensor]`
+            Decoded output and sampled latent codes
+            with samples unwrapped to separate dimension.
+        """
+        latent, _, _, decoded_output = self._sample_and_decode(
+            encoded, target=target, random=random
+        )
+        batch = encoded.mask.size(0)
+        return {
+            "latent": self._unwrap_samples(latent.z, batch, *latent.z.size()[1:]),
+            **decoded_output,
+        }
+
+    def _sample_and_decode(
+        self, encoded: EncoderOutput, target: torch.Tensor = None, random: bool = True
+    ) -> Tuple[LatentSample, torch.Tensor, torch.Tensor, Dict[str, torch.Tensor]]:
+        """
+        Sample latent codes from posterior for encoded sequence and decode them.
+
+        Returns
+        -------
+        `Tuple[LatentSample, torch.Tensor, torch.Tensor, Dict[str, torch.Tensor]]`
+            latent : `LatentSample`
+                Sampled latent codes.
+            log_prob : `torch.Tensor`
+                Posterior log probability for sample.
+            mask : `torch.Tensor`
+                Mask of target (or source if target is not passed) repeated for each sample.
+            decoded_output : `Dict[str, torch.Tensor]`
+                Decoded output with samples unwrapped to separate dimension.
+        """
+        batch = encoded.mask.size(0)
+        # z ~ (batch size * samples, seq length, hidden size) - for NonAuto
+        # z ~ (batch size * samples, hidden size) - for Auto
+        # posterior_log_prob ~ (batch size * samples)
+        latent, posterior_log_prob = self.sample_from_posterior(encoded, random=random)
+        # mask ~ (batch * samples, seq length)
+        mask = self._repeat_samples(
+            util.get_tokens_mask(target) if target is not None else encoded.mask
+        )
+        # target ~ (batch * samples, seq length)
+        target = self._repeat_samples(target) if target is not None else None
+        decoded_output = {
+            x: self._unwrap_samples(tensor, batch, *tensor.size()[1:])
+            for x, tensor in self.decode(latent.z, mask, target=target).items()
+        }
+        return latent, posterior_log_prob, mask, decoded_output
+
     def sample(
         self,
         samples: int,
@@ -351,6 +419,10 @@ class VAELmModel(TorchModule, Registrable):
         """
         raise NotImplementedError()
 
+    def _repeat_samples(self, x: torch.Tensor) -> torch.Tensor:
+        """Repeat `x` for each posterior sample. Inverse of `_unwrap_samples`."""
+        return repeat(x, "batch seq -> (batch samples) seq", samples=self.nsamples_posterior)
+
     def _unwrap_samples(self, x: torch.Tensor, batch: int, *sizes) -> torch.Tensor:
         """Unwrap samples to separate dimension."""
         return x.view(batch, self.nsamples_posterior, *sizes)
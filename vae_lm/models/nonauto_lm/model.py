@@ -1,5 +1,7 @@
 from typing import List, Tuple, Dict, Type, T, Iterable
 import torch
+import warnings
+from contextlib import nullcontext
 from einops import repeat
 from itertools import chain
 import vae_lm.nn.utils as util
@@ -32,6 +34,8 @@ class NonAutoModel(VAELmModel):
         kl_scheduler: WeightScheduler,
         iwae: bool = False,
         label_smoothing: float = 0.0,
+        compile: bool = False,
+        amp: bool = False,
     ) -> None:
         super().__init__(
             vocab=vocab,
@@ -51,14 +55,43 @@ class NonAutoModel(VAELmModel):
             self._decoder.get_output_size(),
             vocab.get_vocab_size(namespace="target"),
         )
+        # Compiled functions for inference. We compile bound methods instead of modules
+        # so that state dict stays the same and weights are shared with eager modules.
+        self._compiled_encoder = None
+        self._compiled_decoder = None
+        self._compiled_project_and_predict = None
+        # Whether to return softmaxed logits from decode or not
+        self._return_probs = False
+        if compile:
+            self._compile()
+        # Mixed precision for encoder and decoder. Flows stay in full precision.
+        self._amp = amp
+        if amp and not hasattr(torch, "autocast"):
+            warnings.warn(
+                "bfloat16 autocast is not available in the installed PyTorch version. "
+                "Running model in full precision."
+            )
+            self._amp = False
 
     @property
     def nsamples_posterior(self) -> int:
         return self._posterior.samples
 
+    @property
+    def use_compiled(self) -> bool:
+        # Use compiled functions only for inference as training and validation
+        # would recompile them on every new batch shape.
+        return self._compiled_decoder is not None and self._inference
+
     def set_samples(self, samples: int) -> None:
         self._posterior.samples = samples
 
+    def _autocast(self):
+        """Get bfloat16 autocast context for CUDA if mixed precision is enabled."""
+        if self._amp and self.device.type == "cuda":
+            return torch.autocast("cuda", dtype=torch.bfloat16)
+        return nullcontext()
+
     @overrides
     def encode(self, tokens: torch.Tensor) -> EncoderOutput:
         """
@@ -69,9 +102,13 @@ class NonAutoModel(VAELmModel):
         `EncoderOutput`
             Encoded tokens, context and mask for them.
         """
-        embedded_tokens = self._embedder(tokens)
         mask = util.get_tokens_mask(tokens)
-        return self._encoder(embedded_tokens, mask)
+        encoder = self._compiled_encoder if self.use_compiled else self._encoder
+        with self._autocast():
+            embedded_tokens = self._embedder(tokens)
+            encoded = encoder(embedded_tokens, mask)
+        # Posterior and its flows need full precision
+        return encoded._replace(output=encoded.output.float(), ctx=encoded.ctx.float())
 
     @overrides
     def decode(
@@ -94,24 +131,58 @@ class NonAutoModel(VAELmModel):
         `Dict[str, torch.Tensor]`
             logits : `torch.Tensor`
                 Logits after decoding.
-            probs : `torch.Tensor`
-                Softmaxed logits.
             preds : `torch.Tensor`
                 Predicted tokens.
+            probs : `torch.Tensor`, optional
+                Softmaxed logits if `_return_probs` is set.
             loss : `torch.Tensor`, optional
                 Reconstruction error if target is passed.
         """
-        # output_dict ~ logits, probs, preds
-        logits = self._vocab_projection(self._decoder(z, mask))
-        output_dict = {"logits": logits, "probs": torch.softmax(logits, dim=-1)}
-        output_dict["preds"] = torch.argmax(output_dict["probs"], dim=-1)
-        # Get padding mask
+        # output_dict ~ logits, preds, probs (optional)
+        with self._autocast():
+            if self.use_compiled:
+                hidden = self._compiled_decoder(z, mask)
+                logits, preds = self._compiled_project_and_predict(hidden)
+            else:
+                logits, preds = self._project_and_predict(self._decoder(z, mask))
+        # Compute loss and softmax in full precision
+        output_dict = {"logits": logits.float(), "preds": preds}
+        # Softmax over vocabulary is expensive so compute it only on demand
+        if self._return_probs:
+            output_dict["probs"] = torch.softmax(output_dict["logits"], dim=-1)
+        # Padding is ignored in loss so we do not need to pass mask
         if target is not None:
-            weights = util.get_tokens_mask(target).float()
-            loss = self._loss(output_dict["logits"], target, weights=weights)
-            output_dict["loss"] = loss
+            output_dict["loss"] = self._loss(output_dict["logits"], target)
         return output_dict
 
+    def _project_and_predict(self, hidden: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Project decoder output to vocabulary and get logits with predicted tokens."""
+        # hidden ~ (batch size, seq length, hidden size)
+        # logits ~ (batch size, seq length, vocab size)
+        # Flatten hidden to project it with a single addmm with fused bias addition
+        logits = torch.addmm(
+            self._vocab_projection.bias,
+            hidden.reshape(-1, hidden.size(-1)),
+            self._vocab_projection.weight.t(),
+        ).view(*hidden.size()[:-1], -1)
+        # Softmax is monotonic so argmax over logits gives the same tokens
+        preds = torch.argmax(logits, dim=-1)
+        return logits, preds
+
+    def _compile(self) -> None:
+        """Compile encoder, decoder and vocab projection with `torch.compile` if it is available."""
+        if not hasattr(torch, "compile"):
+            warnings.warn(
+                "torch.compile is not available in the installed PyTorch version. "
+                "Running model in eager mode."
+            )
+            return
+        self._compiled_encoder = torch.compile(self._encoder.forward)
+        self._compiled_decoder = torch.compile(
+            self._decoder.forward, mode="reduce-overhead", fullgraph=False
+        )
+        self._compiled_project_and_predict = torch.compile(self._project_and_predict)
+
     @overrides
     def sample_from_prior(
         self, samples: int, lengths: List[int] = None
@@ -136,6 +207,7 @@ class NonAutoModel(VAELmModel):
             mask : `torch.Tensor`
                 Mask for sampled tensor.
         """
+        lengths = torch.as_tensor(lengths, dtype=torch.long, device=self.device)
         return PriorSample(*self._prior.sample(samples, lengths))
 
     @overrides
@@ -16,7 +16,7 @@ class FlowPrior(DefaultPrior):
     def sample(
         self,
         batch: int,
-        lengths: List[int],
+        lengths: torch.LongTensor,
         samples: int = 1,
     ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
         epsilon, _, mask = super().sample(batch, lengths, samples)
@@ -1,4 +1,4 @@
-from typing import Tuple, List
+from typing import Tuple
 import torch
 import torch.distributions as D
 from overrides import overrides
@@ -105,10 +105,11 @@ class DefaultPrior(Prior):
     def sample(
         self,
         batch: int,
-        lengths: List[int],
+        lengths: torch.LongTensor,
         samples: int = 1,
     ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-        lengths = torch.LongTensor(lengths).to(self.device)
+        # No-op if lengths is already a tensor on the right device
+        lengths = torch.as_tensor(lengths, dtype=torch.long, device=self.device)
         if lengths.size(0) == 1:
             lengths = lengths.expand(batch)
         max_length = lengths.max().item()
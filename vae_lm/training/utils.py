@@ -1,16 +1,17 @@
-from typing import NamedTuple, Dict, Callable, Union
+from typing import NamedTuple, Dict, Callable, Union, Optional
 import os
 import json
-import wandb
 import torch
+import time
 import random
 import shutil
+import hashlib
 import tarfile
 import tempfile
+import subprocess
 import numpy as np
 from pathlib import Path
 from loguru import logger
-from copy import deepcopy
 from functools import wraps
 import torch.distributed as dist
 import vae_lm.training.ddp as ddp
@@ -18,6 +19,21 @@ from contextlib import contextmanager
 from torch_nlp_utils.common import Params
 from vae_lm.utils.base import run_on_rank_zero
 
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
 # Modules
 from vae_lm.models.base import VAELmModel
 
@@ -25,6 +41,12 @@ from vae_lm.models.base import VAELmModel
 CONFIG_NAME = "config.json"
 WEIGHTS_NAME = "weights.pt"
 METRICS_NAME = "metrics.json"
+ARCHIVE_STAMP_NAME = ".archive_stamp"
+CHECKSUM_SUFFIX = ".crc32c"
+# Use zstd for archives if it is installed as it is much faster than gzip
+ARCHIVE_NAME = "model.tar.zst" if zstd is not None else "model.tar.gz"
+# Cached archives used within this window are never evicted as other processes might read them
+ARCHIVE_CACHE_GRACE_SECONDS = 600
 
 
 class TorchBatchError(Exception):
@@ -53,9 +75,10 @@ def archive_model(
     serialization_dir: Path,
     weights: Path,
     archive_path: Path = None,
-) -> None:
+) -> Optional[Path]:
     """
-    Archive the model weights, its training configuration, and its vocabulary to `model.tar.gz`.
+    Archive the model weights, its training configuration, and its vocabulary to `model.tar.zst`
+    if `zstandard` is installed or to `model.tar.gz` otherwise.
 
     Parameters
     ----------
@@ -64,9 +87,15 @@ def archive_model(
     weights : `Path`, required
         Which weights file to include in the archive. The default is `best.th`.
     archive_path : `str`, optional, (default = `None`)
-        A full path to serialize the model to. The default is "model.tar.gz" inside the
+        A full path to serialize the model to. The default is `ARCHIVE_NAME` inside the
         serialization_dir. If you pass a directory here, we'll serialize the model
-        to "model.tar.gz" inside the directory.
+        to `ARCHIVE_NAME` inside the directory. Compression is chosen by suffix:
+        `.tar.zst` for zstd and gzip otherwise.
+
+    Returns
+    -------
+    `Path`
+        Path to the archive or `None` if model could not be archived.
     """
     # Check weights
     weights_file = weights / "model.pt"
@@ -82,19 +111,64 @@ def archive_model(
     config_file = serialization_dir / CONFIG_NAME
     if not config_file.exists():
         logger.error(f"config file {config_file} does not exist, unable to archive model.")
+        return
     # Check archive path
     if archive_path is not None:
         archive_file = archive_path
         if archive_file.is_dir():
-            archive_file = archive_file / "model.tar.gz"
+            archive_file = archive_file / ARCHIVE_NAME
     else:
-        archive_file = serialization_dir / "model.tar.gz"
+        archive_file = serialization_dir / ARCHIVE_NAME
+    # Skip archiving if files have not changed since the last run
+    vocabulary_dir = serialization_dir / "vocabulary"
+    stamp_file = archive_file.parent / ARCHIVE_STAMP_NAME
+    # Directory mtime does not change when files are rewritten in place
+    # so we use mtimes of vocabulary files instead.
+    vocabulary_files = sorted(vocabulary_dir.rglob("*")) if vocabulary_dir.exists() else []
+    stamp = hashlib.blake2b(
+        ":".join(
+            [str(archive_file)]
+            + [
+                str(path.stat().st_mtime_ns)
+                for path in (weights_file, config_file, metrics_file)
+                if path.exists()
+            ]
+            + [f"{path.name}={path.stat().st_mtime_ns}" for path in vocabulary_files]
+        ).encode()
+    ).hexdigest()
+    if archive_file.exists() and stamp_file.exists() and stamp_file.read_text() == stamp:
+        logger.info(f"Archive {archive_file} is up to date.")
+        return archive_file
     logger.info(f"Archiving data to {archive_file}.")
-    with tarfile.open(archive_file, "w:gz") as archive:
+    # Remove old stamp so that an interrupted archiving is not considered up to date
+    if stamp_file.exists():
+        stamp_file.unlink()
+
+    def add_files(archive: tarfile.TarFile) -> None:
         archive.add(config_file, arcname=CONFIG_NAME)
         archive.add(weights_file, arcname=WEIGHTS_NAME)
         archive.add(metrics_file, arcname=METRICS_NAME)
-        archive.add(str(serialization_dir / "vocabulary"), arcname="vocabulary")
+        archive.add(str(vocabulary_dir), arcname="vocabulary")
+
+    if _is_zstd_archive(archive_file):
+        compressor = zstd.ZstdCompressor(level=3, threads=-1)
+        with archive_file.open("wb") as raw, compressor.stream_writer(raw) as stream:
+            with tarfile.open(fileobj=stream, mode="w|") as archive:
+                add_files(archive)
+    else:
+        with tarfile.open(archive_file, "w:gz") as archive:
+            add_files(archive)
+    # Attach checksum for integrity check on load
+    checksum = _crc32c_checksum(archive_file)
+    checksum_file = Path(f"{archive_file}{CHECKSUM_SUFFIX}")
+    if checksum is not None:
+        checksum_file.write_text(checksum)
+    elif checksum_file.exists():
+        # Remove stale checksum from previous archive as it would fail verification
+        checksum_file.unlink()
+    # Write stamp last so that archive is rebuilt if any step above fails
+    stamp_file.write_text(stamp)
+    return archive_file
 
 
 def load_archive(
@@ -102,7 +176,8 @@ def load_archive(
     cuda_device: int = -1,
 ) -> Archive:
     """
-    Instantiates an Archive from an archived `tar.gz` file.
+    Instantiates an Archive from an archived `tar.gz` or `tar.zst` file.
+    Extracted archives are cached so subsequent loads of the same archive skip extraction.
 
     Parameters
     ----------
@@ -113,31 +188,31 @@ def load_archive(
         corresponding GPU. Otherwise it will be loaded onto the CPU.
     """
     logger.info(f"Loading archive file {archive_file}")
-    tempdir = None
+    if archive_file.is_dir():
+        return _load_serialization_dir(archive_file, cuda_device)
+    with extracted_archive(archive_file) as serialization_dir:
+        return _load_serialization_dir(Path(serialization_dir), cuda_device)
+
+
+def _load_serialization_dir(serialization_dir: Path, cuda_device: int = -1) -> Archive:
+    weights_path = serialization_dir / WEIGHTS_NAME
+    # Load config
+    config = Params.from_file(str(serialization_dir / CONFIG_NAME))
+    # Load metrics
+    metrics_bytes = (serialization_dir / METRICS_NAME).read_bytes()
     try:
-        if archive_file.is_dir():
-            serialization_dir = archive_file
-        else:
-            with extracted_archive(archive_file, cleanup=False) as tempdir:
-                serialization_dir = Path(tempdir)
-        weights_path = serialization_dir / WEIGHTS_NAME
-        # Load config
-        config = Params.from_file(str(serialization_dir / CONFIG_NAME))
-        # Load metrics
-        with (serialization_dir / METRICS_NAME).open("r", encoding="utf-8") as file:
-            metrics = json.load(file)
-        # Instantiate model. Use a duplicate of the config, as it will get consumed.
-        model_params = config.duplicate()
-        model_params["vocabulary"] = str(serialization_dir / "vocabulary")
-        model = VAELmModel.load(
-            model_params,
-            weights=weights_path,
-            device=cuda_device,
-        )
-    finally:
-        if tempdir is not None:
-            logger.info(f"Removing temporary unarchived model dir at {tempdir}")
-            shutil.rmtree(tempdir, ignore_errors=True)
+        metrics = _json.loads(metrics_bytes)
+    except _json.JSONDecodeError:
+        # orjson rejects NaN and Infinity which stdlib json writes for diverged runs
+        metrics = json.loads(metrics_bytes)
+    # Instantiate model. Use a duplicate of the config, as it will get consumed.
+    model_params = config.duplicate()
+    model_params["vocabulary"] = str(serialization_dir / "vocabulary")
+    model = VAELmModel.load(
+        model_params,
+        weights=weights_path,
+        device=cuda_device,
+    )
     return Archive(
         model=model,
         config=config,
@@ -146,32 +221,43 @@ def load_archive(
 
 
 @contextmanager
-def extracted_archive(resolved_archive_file, cleanup=True):
+def extracted_archive(resolved_archive_file, cleanup=True, use_cache=True):
+    """
+    Extract archive to a temporary directory and yield it.
+    If `use_cache` is True archive is extracted once to a cache directory
+    in `XDG_CACHE_HOME` which is reused by later calls and never cleaned up here.
+    If cache directory could not be created we fall back to a temporary directory.
+    """
+    cache_dir = _archive_cache_dir(resolved_archive_file) if use_cache else None
+    if cache_dir is not None:
+        # Update modification time first for LRU eviction so that other processes
+        # do not evict the directory while we are reading it.
+        try:
+            os.utime(cache_dir)
+        except OSError:
+            pass
+        if not _is_extracted(cache_dir):
+            # Extract to a temporary directory in cache root and rename it
+            # so that other processes never see a partially extracted archive.
+            tempdir = tempfile.mkdtemp(prefix=".extracting-", dir=cache_dir.parent)
+            try:
+                _extract_archive(resolved_archive_file, tempdir)
+                os.rename(tempdir, cache_dir)
+            except OSError:
+                # Another process has already extracted the same archive
+                if not _is_extracted(cache_dir):
+                    raise
+            finally:
+                shutil.rmtree(tempdir, ignore_errors=True)
+            _evict_archive_cache(cache_dir.parent, keep=cache_dir)
+        else:
+            logger.info(f"Using cached unarchived model dir at {cache_dir}")
+        yield str(cache_dir)
+        return
     tempdir = None
     try:
         tempdir = tempfile.mkdtemp()
-        logger.info(f"Extracting archive file {resolved_archive_file} to temp dir {tempdir}")
-        with tarfile.open(resolved_archive_file, "r:gz") as archive:
-            def is_within_directory(directory, target):
-                
-                abs_directory = os.path.abspath(directory)
-                abs_target = os.path.abspath(target)
-            
-                prefix = os.path.commonprefix([abs_directory, abs_target])
-                
-                return prefix == abs_directory
-            
-            def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-            
-                for member in tar.getmembers():
-                    member_path = os.path.join(path, member.name)
-                    if not is_within_directory(path, member_path):
-                        raise Exception("Attempted Path Traversal in Tar File")
-            
-                tar.extractall(path, members, numeric_owner=numeric_owner) 
-                
-            
-            safe_extract(archive, tempdir)
+        _extract_archive(resolved_archive_file, tempdir)
         yield tempdir
     finally:
         if tempdir is not None and cleanup:
@@ -179,6 +265,158 @@ def extracted_archive(resolved_archive_file, cleanup=True):
             shutil.rmtree(tempdir, ignore_errors=True)
 
 
+def _extract_archive(resolved_archive_file: Path, directory: str) -> None:
+    _verify_checksum(resolved_archive_file)
+    logger.info(f"Extracting archive file {resolved_archive_file} to dir {directory}")
+    pigz = shutil.which("pigz")
+    if _is_zstd_archive(resolved_archive_file):
+        decompressor = zstd.ZstdDecompressor()
+        with open(resolved_archive_file, "rb") as raw, decompressor.stream_reader(raw) as stream:
+            with tarfile.open(fileobj=stream, mode="r|") as archive:
+                _safe_extract(archive, directory)
+    elif pigz is not None:
+        # Decompress with parallel gzip and read tar as a stream
+        process = subprocess.Popen(
+            [pigz, "-dc", str(resolved_archive_file)], stdout=subprocess.PIPE
+        )
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+                _safe_extract(archive, directory)
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, process.args)
+    else:
+        with tarfile.open(resolved_archive_file, "r:gz") as archive:
+            _safe_extract(archive, directory)
+
+
+def _crc32c_checksum(path: Path, chunk_size: int = 1 << 24) -> Optional[str]:
+    """
+    Compute CRC32C checksum of a file in hex.
+    Returns None if `google-crc32c` is not installed or it has no hardware accelerated
+    implementation for the current CPU as a pure python one is too slow for large archives.
+    """
+    if google_crc32c is None or google_crc32c.implementation != "c":
+        return None
+    crc = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            crc = google_crc32c.extend(crc, chunk)
+    return f"{crc:08x}"
+
+
+def _verify_checksum(archive_file: Path) -> None:
+    """Verify archive with its CRC32C sidecar file if both of them are available."""
+    checksum_file = Path(f"{archive_file}{CHECKSUM_SUFFIX}")
+    if not checksum_file.exists():
+        return
+    checksum = _crc32c_checksum(archive_file)
+    if checksum is not None and checksum != checksum_file.read_text().strip():
+        raise Exception(
+            f"Checksum mismatch for archive {archive_file}. The archive might be corrupted."
+        )
+
+
+def _archive_cache_dir(resolved_archive_file: Path) -> Optional[Path]:
+    """
+    Get cache directory for extracted archive based on its path and modification time.
+    Returns None if cache root could not be created, e.g. home directory is read-only.
+    """
+    resolved_archive_file = Path(resolved_archive_file).resolve()
+    key = hashlib.blake2b(
+        f"{resolved_archive_file}:{resolved_archive_file.stat().st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+    cache_root = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "vae_lm"
+    try:
+        cache_root.mkdir(parents=True, exist_ok=True)
+    except OSError as error:
+        logger.warning(f"Unable to create archive cache at {cache_root}, cache is disabled: {error}")
+        return None
+    return cache_root / key
+
+
+def _is_extracted(directory: Path) -> bool:
+    return all(
+        (directory / name).exists()
+        for name in (CONFIG_NAME, WEIGHTS_NAME, METRICS_NAME, "vocabulary")
+    )
+
+
+def _evict_archive_cache(cache_root: Path, keep: Path) -> None:
+    """
+    Remove least recently used extracted archives if cache exceeds its size limit.
+    Entries used within `ARCHIVE_CACHE_GRACE_SECONDS` are kept as other processes might read them.
+    Entries are renamed before removal so that they are never seen partially deleted.
+    """
+    max_size = float(os.environ.get("VAE_LM_ARCHIVE_CACHE_GB", 10)) * 1024 ** 3
+    min_mtime = time.time() - ARCHIVE_CACHE_GRACE_SECONDS
+    # Sort from the most recently used to the least one
+    cached = []
+    for directory in cache_root.iterdir():
+        if not directory.is_dir() or directory.name.startswith("."):
+            continue
+        try:
+            cached.append((directory.stat().st_mtime, directory))
+        except OSError:
+            # Directory has been evicted by another process
+            continue
+    cached.sort(reverse=True)
+    total_size = 0
+    for mtime, directory in cached:
+        total_size += _directory_size(directory)
+        if total_size <= max_size or directory == keep or mtime > min_mtime:
+            continue
+        evicting = cache_root / f".evicting-{directory.name}-{os.getpid()}"
+        try:
+            os.rename(directory, evicting)
+        except OSError:
+            # Directory has been evicted by another process
+            continue
+        logger.info(f"Removing cached unarchived model dir at {directory}")
+        shutil.rmtree(evicting, ignore_errors=True)
+
+
+def _directory_size(directory: Path) -> int:
+    """Get total size of files in directory which might be removed concurrently."""
+    size = 0
+    try:
+        for path in directory.rglob("*"):
+            if path.is_file():
+                size += path.stat().st_size
+    except OSError:
+        pass
+    return size
+
+
+def _is_zstd_archive(archive_file: Path) -> bool:
+    """Check whether archive is compressed with zstd based on its suffix."""
+    is_zstd = str(archive_file).endswith(".tar.zst")
+    if is_zstd and zstd is None:
+        raise ImportError(f"zstandard is not installed, unable to process archive {archive_file}.")
+    return is_zstd
+
+
+def _is_within_directory(directory: str, target: str) -> bool:
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+    prefix = os.path.commonprefix([abs_directory, abs_target])
+    return prefix == abs_directory
+
+
+def _safe_extract(archive: tarfile.TarFile, path: str = ".") -> None:
+    """
+    Extract tar members one by one checking for path traversal.
+    It works for both random access and stream (`r|`) tar modes.
+    """
+    for member in archive:
+        member_path = os.path.join(path, member.name)
+        if not _is_within_directory(path, member_path):
+            raise Exception("Attempted Path Traversal in Tar File")
+        archive.extract(member, path)
+
+
 def seed_everything(seed: int) -> None:
     random.seed(seed)
     os.environ["PYTHONHASHSEED"] = str(seed)
@@ -204,6 +442,8 @@ def configure_world(func: Callable) -> Callable:
         # Run wandb in master process
         # TODO: Think about config unflat for wandb sweep to work for hyperparameters optimization.
         if is_master and use_wandb:
+            import wandb
+
             logger.use_wandb = True
             wandb.init(
                 project=os.getenv("WANDB_PROJECT_NAME"),
@@ -228,15 +468,18 @@ def configure_world(func: Callable) -> Callable:
                 # because wandb hangs in distributed training mode
                 # and we also need to finish it manually.
                 best_model = serialization_dir / "best-model"
+                archive_file = None
                 if best_model.exists():
-                    archive_model(
+                    archive_file = archive_model(
                         serialization_dir=serialization_dir,
                         weights=best_model,
                     )
                 if use_wandb:
+                    import wandb
+
                     # Save archived model to wandb if exists
-                    if best_model.exists():
-                        wandb.save(str(serialization_dir / "model.tar.gz"))
+                    if archive_file is not None:
+                        wandb.save(str(archive_file))
                     wandb.finish()
         return result
 
@@ -245,11 +488,11 @@ def configure_world(func: Callable) -> Callable:
 
 
 def description_from_metrics(metrics: Dict[str, float]) -> str:
-    # Copy dict for safety
-    metrics = deepcopy(metrics)
     # Configure loss first
-    loss = f"loss: {metrics.pop('loss'):.4f}, "
-    return loss + ", ".join([f"{name}: {value:.4f}" for name, value in metrics.items()]) + " ||"
+    loss = f"loss: {metrics['loss']:.4f}, "
+    return loss + ", ".join(
+        [f"{name}: {value:.4f}" for name, value in metrics.items() if name != "loss"]
+    ) + " ||"
 
 
 @run_on_rank_zero
@@ -275,14 +518,14 @@ def log_metrics(
         if info is not None
         else f"{mode_str}"
     )
-    max_length = max(len(x) for x in metrics)
+    # Log only numbers to stdout as with additional loggers
+    # we might want to log DataFrames, distributions and etc.
+    numeric_metrics = [(k, v) for k, v in metrics.items() if isinstance(v, (float, int))]
     # Sort by length to make it prettier
-    for metric in sorted(metrics, key=lambda x: (len(x), x)):
-        metric_value = metrics.get(metric)
-        # Log only numbers to stdout as with additional loggers
-        # we might want to log DataFrames, distributions and etc.
-        if isinstance(metric_value, (float, int)):
-            logger.info(f"{metric.ljust(max_length)} | {metric_value:.4f}")
+    numeric_metrics.sort(key=lambda x: (len(x[0]), x[0]))
+    max_length = max((len(k) for k, _ in numeric_metrics), default=0)
+    for metric, metric_value in numeric_metrics:
+        logger.info(f"{metric.ljust(max_length)} | {metric_value:.4f}")
     logger.bind(metrics={f"{mode_str.lower()}/{k}": v for k, v in metrics.items()}).debug(
         "Logging metrics to additional sources."
     )
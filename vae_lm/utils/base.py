@@ -1,22 +1,10 @@
 from typing import Callable, Any
 import os
 import torch
-import wandb
 from loguru import logger
 from functools import wraps
 
 
-def run_on_rank_zero(func: Callable) -> Callable:
-    """Run function only on rank 0 process."""
-
-    @wraps(func)
-    def wrapper(*args, **kwargs) -> Any:
-        if run_on_rank_zero.rank == 0:
-            return func(*args, **kwargs)
-
-    return wrapper
-
-
 def _get_rank() -> int:
     rank_keys = ("RANK", "LOCAL_RANK")
     for key in rank_keys:
@@ -26,7 +14,20 @@ def _get_rank() -> int:
     return 0
 
 
-run_on_rank_zero.rank = getattr(run_on_rank_zero, "rank", _get_rank())
+# Rank is set once at process start so there is no need to check it on every call
+_IS_RANK_ZERO = _get_rank() == 0
+
+
+def run_on_rank_zero(func: Callable) -> Callable:
+    """Run function only on rank 0 process."""
+    if _IS_RANK_ZERO:
+        return func
+
+    @wraps(func)
+    def noop(*args, **kwargs) -> Any:
+        return None
+
+    return noop
 
 
 class wandb_watch:
@@ -54,6 +55,8 @@ class wandb_watch:
     @run_on_rank_zero
     def _set_watch(self, module: torch.nn.Module) -> None:
         if not self._is_watched and getattr(logger, "use_wandb", False):
+            import wandb
+
             logger.debug("Watching torch model info with wandb.")
             wandb.watch(module, log=self._log)
             self._is_watched = True
@@ -1,6 +1,6 @@
 from typing import Union, Dict, Any
 import torch
-import wandb
+import pickle
 import logging
 import pandas as pd
 from pathlib import Path
@@ -29,27 +29,43 @@ class SaveBatchHandler(logging.Handler):
     def __init__(self, level: Union[int, str] = logging.NOTSET) -> None:
         super().__init__(level=level)
         self._directory = Path.cwd() / "error-batches"
-        if not self._directory.exists():
-            self._directory.mkdir(exist_ok=False)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # Directories that have already been created
+        self._seen_dirs = set()
 
     @run_on_rank_zero
     def emit(self, record: logging.LogRecord) -> None:
         # Construct directory to save batch with error
         # We need it for better hierarchy
-        save_directory = self._directory / record.extra.get("serialization_dir")
-        if not save_directory.exists():
-            save_directory.mkdir(exist_ok=False)
+        serialization_dir = record.extra.get("serialization_dir")
+        save_directory = self._directory / serialization_dir
+        if serialization_dir not in self._seen_dirs:
+            save_directory.mkdir(parents=True, exist_ok=True)
+            self._seen_dirs.add(serialization_dir)
         # Use current time as an identifier of an error batch
         time = datetime.now()
         file_suffix = time.strftime("%d-%m-%Y_%H-%M")
+        # Batch is usually a dictionary of tensors from `Batch.as_dict`
+        batch = record.extra.get("batch", torch.Tensor())
+        if isinstance(batch, dict):
+            batch = {key: self._prepare_tensor(value) for key, value in batch.items()}
+        else:
+            batch = self._prepare_tensor(batch)
+        # Legacy format skips zip archive overhead for small dumps
         torch.save(
-            {
-                "message": record.extra.get("message", ""),
-                "batch": record.extra.get("batch", torch.Tensor()),
-            },
+            {"message": record.extra.get("message", ""), "batch": batch},
             save_directory / f"batch_{file_suffix}.pt",
+            pickle_protocol=min(5, pickle.HIGHEST_PROTOCOL),
+            _use_new_zipfile_serialization=False,
         )
 
+    @staticmethod
+    def _prepare_tensor(value: Any) -> Any:
+        """Move tensor to CPU in contiguous memory to avoid extra copy in `torch.save`."""
+        if isinstance(value, torch.Tensor):
+            return value.detach().cpu().contiguous()
+        return value
+
 
 class WandBLoggingHandler(logging.Handler):
     """Log metrics to Weights & Biasses if needed."""
@@ -59,12 +75,14 @@ class WandBLoggingHandler(logging.Handler):
         self._wandb_types_switch = {
             int: lambda x: x,
             float: lambda x: x,
-            pd.DataFrame: lambda x: wandb.Table(dataframe=x),
+            pd.DataFrame: self._to_wandb_table,
         }
 
     @run_on_rank_zero
     def emit(self, record: logging.LogRecord) -> None:
         if getattr(logger, "use_wandb", False):
+            import wandb
+
             metrics = record.extra.get("metrics")
             metrics_to_log = self._prepare_metrics(metrics)
             wandb.log(metrics_to_log)
@@ -75,6 +93,12 @@ class WandBLoggingHandler(logging.Handler):
             for metric, value in metrics.items()
         }
 
+    @staticmethod
+    def _to_wandb_table(dataframe: pd.DataFrame) -> Any:
+        import wandb
+
+        return wandb.Table(dataframe=dataframe)
+
 
 def setup_logging() -> None:
     logger.add(RichExceptionHandler(), level=logging.ERROR, format="{message}")